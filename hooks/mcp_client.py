@@ -5,6 +5,13 @@ import os
 import sys
 import urllib.request
 
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # optional speedup; hooks only need the stdlib
+    _loads = json.loads
+
 TOKEN = os.environ.get("MCP_AUTH_TOKEN", "")
 SERVER = os.environ.get("MCP_SERVER_URL", "https://claude-connector.example.com")
 
@@ -66,7 +73,7 @@ def call_mcp_tool(tool_name: str, arguments: dict, timeout: int = 10) -> dict |
                 content = result["result"].get("content", [])
                 for item in content:
                     if item.get("type") == "text":
-                        return json.loads(item["text"])
+                        return _loads(item["text"])
     except Exception as e:
         print(f"[mcp_client] {tool_name} failed: {type(e).__name__}: {e}", file=sys.stderr)
         return None
@@ -78,11 +85,11 @@ def _parse_sse(raw: str) -> dict | None:
     for line in raw.splitlines():
         if line.startswith("data: "):
             try:
-                return json.loads(line[6:])
+                return _loads(line[6:])
             except json.JSONDecodeError:
                 continue
     # Fall back to parsing the whole thing as JSON (non-SSE response)
     try:
-        return json.loads(raw)
+        return _loads(raw)
     except json.JSONDecodeError:
         return None
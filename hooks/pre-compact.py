@@ -37,6 +37,7 @@ def main():
                 "type": "context",
                 "title": f"Compact — {project} @ {timestamp}",
                 "tags": ["auto-captured", "pre-compact"],
+                "source_session": session_id or None,
             })
         except Exception as e:
             print(f"[pre-compact] save_context failed: {e}", file=sys.stderr)
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-"""SessionEnd hook — saves session summary to shared memory."""
+"""SessionEnd hook — saves session summary and stats to shared memory."""
 
 import json
 import os
@@ -25,8 +25,8 @@ def main():
         json.dump({}, sys.stdout)
         return
 
-    # Extract a structured summary from the transcript
-    summary = extract_summary(transcript_path)
+    # Extract a structured summary and stats from the transcript
+    digest = digest_transcript(transcript_path)
 
     # Update the session record (upserts — session-start already created the row)
     try:
@@ -34,7 +34,8 @@ def main():
             "session_id": session_id,
             "source": "claude_code",
             "project": project,
-            "summary": summary,
+            "summary": digest.summary() if digest else "",
+            "metadata": digest.metadata() if digest else {},
         })
     except Exception as e:
         print(f"[session-end] log_session failed: {e}", file=sys.stderr)
@@ -42,45 +43,132 @@ def main():
     json.dump({}, sys.stdout)
 
 
-def extract_summary(transcript_path: str) -> str:
-    """Extract first user message + last assistant message from transcript."""
+# Caps that keep the digest bounded no matter how long the transcript is
+MAX_TOOLS = 100
+MAX_FILES = 200
+MAX_ERRORS = 20
+FILE_INPUT_KEYS = ("file_path", "notebook_path", "path")
+
+
+class TranscriptDigest:
+    """Accumulates summary text and session stats in one pass over a transcript."""
+
+    def __init__(self):
+        self.first_user = ""
+        self.last_assistant = ""
+        self.turns = 0
+        self.entries = 0
+        self.bytes = 0
+        self.tools: dict[str, int] = {}
+        self.files: dict[str, int] = {}
+        self.errors: list[str] = []
+        self.error_count = 0
+        self.tokens = {"input": 0, "output": 0, "cache_read": 0, "cache_creation": 0}
+        self._last_message_id = None
+
+    def add(self, entry: dict):
+        self.entries += 1
+        # Transcript lines either wrap the message ({"message": {...}}) or are the message
+        msg = entry.get("message") if isinstance(entry.get("message"), dict) else entry
+        role = msg.get("role", "")
+        text = _extract_text(msg)
+
+        if role == "user" and text:
+            self.turns += 1
+            if not self.first_user:
+                self.first_user = text
+        elif role == "assistant" and text:
+            self.last_assistant = text
+
+        content = msg.get("content")
+        if isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict):
+                    self._add_item(item)
+
+        # Each content block of one response is its own line repeating the same
+        # message id and usage, and tool results (no id) can sit in between:
+        #   assistant {id: m1, content: [tool_use], usage}
+        #   user      {content: [tool_result]}
+        #   assistant {id: m1, content: [text], usage}    <- same usage again
+        # so remember the last id seen and skip lines without one.
+        usage = msg.get("usage")
+        message_id = msg.get("id")
+        if message_id:
+            if message_id == self._last_message_id:
+                usage = None
+            self._last_message_id = message_id
+        if isinstance(usage, dict):
+            self.tokens["input"] += usage.get("input_tokens") or 0
+            self.tokens["output"] += usage.get("output_tokens") or 0
+            self.tokens["cache_read"] += usage.get("cache_read_input_tokens") or 0
+            self.tokens["cache_creation"] += usage.get("cache_creation_input_tokens") or 0
+
+    def _add_item(self, item: dict):
+        if item.get("type") == "tool_use":
+            name = item.get("name") or "unknown"
+            if name in self.tools or len(self.tools) < MAX_TOOLS:
+                self.tools[name] = self.tools.get(name, 0) + 1
+            tool_input = item.get("input")
+            if isinstance(tool_input, dict):
+                for key in FILE_INPUT_KEYS:
+                    path = tool_input.get(key)
+                    if isinstance(path, str) and path:
+                        if path in self.files or len(self.files) < MAX_FILES:
+                            self.files[path] = self.files.get(path, 0) + 1
+                        break
+        elif item.get("type") == "tool_result" and item.get("is_error"):
+            self.error_count += 1
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append(_extract_text(item)[:300])
+
+    def summary(self) -> str:
+        parts = []
+        if self.first_user:
+            parts.append(f"Task: {self.first_user[:500]}")
+        if self.last_assistant:
+            parts.append(f"Outcome: {self.last_assistant[:1000]}")
+        return "\n\n".join(parts)
+
+    def metadata(self) -> dict:
+        return {
+            "digest": {
+                "turns": self.turns,
+                "entries": self.entries,
+                "bytes": self.bytes,
+                "tokens": self.tokens,
+                "tools": self.tools,
+                "files": self.files,
+                "errors": self.errors,
+                "error_count": self.error_count,
+            }
+        }
+
+
+def digest_transcript(transcript_path: str) -> TranscriptDigest | None:
+    """Stream the transcript once, building the summary and stats together."""
     if not transcript_path or not os.path.exists(transcript_path):
-        return ""
-
-    first_user = ""
-    last_assistant = ""
+        return None
 
+    digest = TranscriptDigest()
     try:
-        with open(transcript_path) as f:
-            for line in f:
-                line = line.strip()
+        with open(transcript_path, "rb") as f:
+            for raw in f:
+                digest.bytes += len(raw)
+                line = raw.strip()
                 if not line:
                     continue
                 try:
                     entry = json.loads(line)
-                    role = entry.get("role", "")
-                    content = _extract_text(entry)
-
-                    if not content:
-                        continue
-
-                    if role == "user" and not first_user:
-                        first_user = content
-                    elif role == "assistant":
-                        last_assistant = content
                 except json.JSONDecodeError:
                     continue
+                if isinstance(entry, dict):
+                    digest.add(entry)
     except Exception as e:
         print(f"[session-end] transcript read failed: {e}", file=sys.stderr)
-        return ""
-
-    parts = []
-    if first_user:
-        parts.append(f"Task: {first_user[:500]}")
-    if last_assistant:
-        parts.append(f"Outcome: {last_assistant[:1000]}")
+        return None
 
-    return "\n\n".join(parts)
+    return digest
 
 
 def _extract_text(entry: dict) -> str:
@@ -1,14 +1,29 @@
 """FastMCP shared memory server."""
 
+import asyncio
+import hmac
+import logging
 import os
+import zlib
+from contextlib import asynccontextmanager
 
+import asyncpg
+import orjson
 from fastmcp import FastMCP
 from fastmcp.server.auth import AccessToken
 from fastmcp.server.auth.providers.in_memory import InMemoryOAuthProvider
+
+try:
+    from fastmcp.tools import ToolResult
+except ImportError:  # fastmcp 2.x
+    from fastmcp.tools.tool import ToolResult
 from mcp.server.auth.settings import ClientRegistrationOptions
-from starlette.responses import JSONResponse
+from mcp.types import TextContent
+from starlette.responses import JSONResponse, StreamingResponse
+
+from server import db, jobs, rollup, transfer
 
-from server import db
+logging.basicConfig(level=logging.INFO)
 
 _token = os.environ.get("MCP_AUTH_TOKEN", "dev-token")
 _base_url = os.environ.get("MCP_BASE_URL", "https://claude-connector.example.com")
@@ -39,6 +54,17 @@ class HybridAuthProvider(InMemoryOAuthProvider):
         return await super().verify_token(token)
 
 
+def _json(data) -> ToolResult:
+    """Encode a tool result with orjson as the tool's only output.
+
+    A ToolResult is passed through as-is, so FastMCP neither re-serializes
+    the result nor builds structuredContent from it and rows are encoded
+    exactly once; datetimes become ISO 8601 strings.
+    """
+    text = orjson.dumps(data, default=str).decode()
+    return ToolResult(content=[TextContent(type="text", text=text)])
+
+
 # TODO: Switch to HybridAuthProvider once Claude.ai fixes OAuth with custom MCP servers
 # See: https://github.com/anthropics/claude-code/issues/11814
 # auth = HybridAuthProvider(base_url=_base_url, static_token=_token)
@@ -52,7 +78,8 @@ async def save_context(
     type: str,
     title: str | None = None,
     tags: list[str] = [],
-) -> dict:
+    source_session: str | None = None,
+) -> ToolResult:
     """Store a piece of context in shared memory.
 
     Use this to save decisions, notes, code changes, or general context
@@ -64,23 +91,30 @@ async def save_context(
         type: One of: decision, context, note, code_change
         title: Optional short title for the artifact
         tags: Optional list of tags for categorization
+        source_session: Optional session_id the context came from
     """
     if type not in ("decision", "context", "note", "code_change"):
-        return {"error": "type must be one of: decision, context, note, code_change"}
+        return _json({"error": "type must be one of: decision, context, note, code_change"})
     result = await db.save_artifact(
-        project=project, type=type, content=content, title=title, tags=tags
+        project=project,
+        type=type,
+        content=content,
+        title=title,
+        tags=tags,
+        source_session=source_session,
     )
-    return {"saved": result}
+    return _json({"saved": result})
 
 
 @mcp.tool()
 async def search_context(
     query: str, project: str = "default", limit: int = 5
-) -> dict:
+) -> ToolResult:
     """Full-text search across shared memory artifacts.
 
     Searches titles (higher weight) and content using PostgreSQL full-text search.
-    Returns ranked results.
+    Results are ordered by score: text rank weighted by artifact type
+    (decisions first) and recency, with auto-captured context demoted.
 
     Args:
         query: Search query (supports natural language and boolean operators)
@@ -88,11 +122,43 @@ async def search_context(
         limit: Maximum number of results (1-50)
     """
     results = await db.search_artifacts(query=query, project=project, limit=limit)
-    return {"results": results, "count": len(results)}
+    return _json({"results": results, "count": len(results)})
 
 
 @mcp.tool()
-async def get_project_summary(project: str = "default") -> dict:
+async def search_across_projects(
+    query: str,
+    projects: list[str] = [],
+    pattern: str = "",
+    limit: int = 10,
+    per_project: int = 0,
+) -> ToolResult:
+    """Full-text search across several projects at once.
+
+    Use this instead of calling search_context once per project, e.g. to
+    include 'default' alongside the current repo or every repo matching 'api-*'.
+
+    Args:
+        query: Search query (supports natural language and boolean operators)
+        projects: Project identifiers to search
+        pattern: Optional glob ('*' and '?') matched against all project names
+        limit: Maximum number of merged results, ordered by score (1-50)
+        per_project: Max results from any one project (0 = even share of limit)
+    """
+    if not projects and not pattern:
+        return _json({"error": "give at least one of: projects, pattern"})
+    found = await db.search_many(
+        query=query,
+        projects=projects,
+        pattern=pattern or None,
+        limit=limit,
+        per_project=per_project or None,
+    )
+    return _json({**found, "count": len(found["results"])})
+
+
+@mcp.tool()
+async def get_project_summary(project: str = "default") -> ToolResult:
     """Get an overview of a project's shared memory.
 
     Returns recent decisions (last 10), recent sessions (last 5),
@@ -101,13 +167,13 @@ async def get_project_summary(project: str = "default") -> dict:
     Args:
         project: Project identifier
     """
-    return await db.get_summary(project=project)
+    return _json(await db.get_summary(project=project))
 
 
 @mcp.tool()
 async def log_decision(
     project: str, decision: str, reasoning: str = ""
-) -> dict:
+) -> ToolResult:
     """Log a decision to shared memory.
 
     Convenience wrapper that saves an artifact with type='decision'.
@@ -124,13 +190,13 @@ async def log_decision(
     result = await db.save_artifact(
         project=project, type="decision", content=content, title=decision[:200]
     )
-    return {"logged": result}
+    return _json({"logged": result})
 
 
 @mcp.tool()
 async def get_recent_activity(
     project: str = "default", hours: int = 48
-) -> dict:
+) -> ToolResult:
     """Get all recent artifacts and sessions.
 
     Returns everything from the last N hours, ordered by recency.
@@ -139,13 +205,17 @@ async def get_recent_activity(
         project: Project identifier
         hours: How many hours back to look (1-720)
     """
-    return await db.get_recent(project=project, hours=hours)
+    return _json(await db.get_recent(project=project, hours=hours))
 
 
 @mcp.tool()
 async def log_session(
-    session_id: str, source: str, project: str = "default", summary: str = ""
-) -> dict:
+    session_id: str,
+    source: str,
+    project: str = "default",
+    summary: str = "",
+    metadata: dict = {},
+) -> ToolResult:
     """Register or update a session in shared memory.
 
     Call at session start to register, and at session end to update with summary.
@@ -155,13 +225,82 @@ async def log_session(
         source: Either 'claude_ai' or 'claude_code'
         project: Project identifier
         summary: Session summary (usually set at session end)
+        metadata: Structured session stats; merged into any existing metadata
     """
     if source not in ("claude_ai", "claude_code"):
-        return {"error": "source must be 'claude_ai' or 'claude_code'"}
+        return _json({"error": "source must be 'claude_ai' or 'claude_code'"})
     result = await db.upsert_session(
-        session_id=session_id, source=source, project=project, summary=summary
+        session_id=session_id,
+        source=source,
+        project=project,
+        summary=summary,
+        metadata=metadata,
     )
-    return {"session": result}
+    return _json({"session": result})
+
+
+@mcp.tool()
+async def get_session_stats(project: str = "default", days: int = 30) -> ToolResult:
+    """Aggregate Claude Code session stats over the last N days.
+
+    Returns session, turn, error and token totals plus the most used tools
+    and most touched files, from the digests saved by the SessionEnd hook.
+
+    Args:
+        project: Project identifier
+        days: How many days back to look (1-365)
+    """
+    return _json(await db.get_session_stats(project=project, days=days))
+
+
+@mcp.tool()
+async def enqueue_job(type: str, params: dict = {}) -> ToolResult:
+    """Queue a maintenance job to run in the background.
+
+    Returns immediately with the job record; poll it with get_job_status.
+
+    Args:
+        type: One of: rollup, retention, reindex
+        params: Job options. rollup: min_age_hours, max_batches.
+            Omitted rollup options use the server defaults.
+            retention: project, older_than_days (both required).
+            reindex: none.
+    """
+    if type not in jobs.HANDLERS:
+        return _json({"error": f"type must be one of: {', '.join(jobs.HANDLERS)}"})
+    if type == "retention":
+        if not params.get("project") or not _is_int(params.get("older_than_days"), 1):
+            return _json({
+                "error": "retention requires params: project, "
+                "older_than_days (positive integer)"
+            })
+    if type == "rollup":
+        if not _is_int(params.get("min_age_hours", 0), 0) or not _is_int(
+            params.get("max_batches", 1), 1
+        ):
+            return _json({
+                "error": "rollup params: min_age_hours (non-negative integer), "
+                "max_batches (positive integer)"
+            })
+    return _json({"job": await jobs.enqueue(type, params)})
+
+
+def _is_int(value, minimum: int) -> bool:
+    # bool is an int subclass; reject it so true/false aren't read as 1/0.
+    return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+
+@mcp.tool()
+async def get_job_status(job_id: int) -> ToolResult:
+    """Get the status, progress and result of a background job.
+
+    Args:
+        job_id: Job id returned by enqueue_job
+    """
+    job = await jobs.get_job(job_id)
+    if job is None:
+        return _json({"error": f"job {job_id} not found"})
+    return _json({"job": job})
 
 
 @mcp.custom_route("/health", methods=["GET"])
@@ -176,8 +315,79 @@ async def health(request):
         return JSONResponse({"status": "unhealthy", "error": str(e)}, status_code=503)
 
 
+def _authorized(request) -> bool:
+    """Bulk routes bypass MCP auth, so they always require the static token."""
+    header = request.headers.get("authorization", "")
+    return hmac.compare_digest(header, f"Bearer {_token}")
+
+
+@mcp.custom_route("/export/{project}", methods=["GET"])
+async def export_project(request):
+    """Stream a project's sessions and artifacts as gzip'd NDJSON."""
+    if not _authorized(request):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    project = request.path_params["project"]
+    return StreamingResponse(
+        transfer.export_project(project),
+        media_type="application/gzip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{project}.ndjson.gz"'
+        },
+    )
+
+
+@mcp.custom_route("/import", methods=["POST"])
+async def import_project(request):
+    """Load a gzip'd NDJSON dump produced by /export.
+
+    Query params: project (rename target), on_conflict ('skip' or 'update').
+    """
+    if not _authorized(request):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    on_conflict = request.query_params.get("on_conflict", "skip")
+    if on_conflict not in ("skip", "update"):
+        return JSONResponse(
+            {"error": "on_conflict must be 'skip' or 'update'"}, status_code=400
+        )
+    try:
+        result = await transfer.import_ndjson(
+            request.stream(),
+            project=request.query_params.get("project"),
+            on_conflict=on_conflict,
+        )
+    except (ValueError, zlib.error, asyncpg.DataError,
+            asyncpg.IntegrityConstraintViolationError) as e:
+        # Bad dump contents are the client's problem; anything else is a 500.
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return JSONResponse({"imported": result})
+
+
 # ASGI app for uvicorn
 app = mcp.http_app(path="/mcp", stateless_http=True)
+_mcp_lifespan = app.router.lifespan_context
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Wrap FastMCP's lifespan so each worker owns its pool and background tasks."""
+    async with _mcp_lifespan(app):
+        if db.EAGER_POOL:
+            await db.get_pool()
+        tasks = []
+        if rollup.INTERVAL_SECONDS > 0:
+            tasks.append(asyncio.create_task(rollup.run_forever()))
+        if jobs.WORKER_ENABLED:
+            tasks.append(asyncio.create_task(jobs.run_worker()))
+        try:
+            yield
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await db.close_pool()
+
+
+app.router.lifespan_context = lifespan
 
 if __name__ == "__main__":
     mcp.run(transport="http", host="0.0.0.0", port=8080, path="/mcp", stateless_http=True)
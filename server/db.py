@@ -1,31 +1,113 @@
 """PostgreSQL database layer using asyncpg."""
 
+import asyncio
 import json
+import logging
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import asyncpg
 
+log = logging.getLogger(__name__)
+
 _pool: asyncpg.Pool | None = None
+# Background tasks and the first request may all call get_pool() at once.
+_pool_lock = asyncio.Lock()
+# Caps connections held by background work (rollup, jobs); sized on first use.
+_background_slots: asyncio.Semaphore | None = None
+
+# Total number of connections this deployment may hold open, shared by all
+# uvicorn workers (uvicorn reads WEB_CONCURRENCY as its default --workers).
+POOL_BUDGET = int(os.environ.get("DB_POOL_BUDGET", "10"))
+WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "2"))
+# Create the pool at startup (ASGI lifespan) instead of on the first request.
+EAGER_POOL = os.environ.get("DB_EAGER_POOL", "0") == "1"
+# pgbouncer in transaction pooling mode can't track named prepared statements.
+PGBOUNCER = os.environ.get("DB_PGBOUNCER", "0") == "1"
+
+# Upper bound on projects fanned out by one multi-project search.
+MAX_SEARCH_PROJECTS = 50
+
+# Arbitrary key for the advisory lock that serializes schema setup across workers.
+_SCHEMA_LOCK_KEY = 7_246_001
+
+
+def pool_sizes() -> tuple[int, int]:
+    """Per-worker (min_size, max_size) derived from the shared connection budget."""
+    max_size = max(1, POOL_BUDGET // WORKERS)
+    return min(POOL_MIN_SIZE, max_size), max_size
 
 
 async def get_pool() -> asyncpg.Pool:
     global _pool
-    if _pool is None:
-        _pool = await asyncpg.create_pool(
-            os.environ["DATABASE_URL"],
-            min_size=2,
-            max_size=10,
-        )
-        await _init_schema(_pool)
+    if _pool is not None:
+        return _pool
+    async with _pool_lock:
+        if _pool is None:
+            min_size, max_size = pool_sizes()
+            _warn_pool_budget(max_size)
+            kwargs = {}
+            if PGBOUNCER:
+                kwargs["statement_cache_size"] = 0
+            pool = await asyncpg.create_pool(
+                os.environ["DATABASE_URL"],
+                min_size=min_size,
+                max_size=max_size,
+                **kwargs,
+            )
+            try:
+                await _init_schema(pool)
+            except BaseException:
+                await pool.close()
+                raise
+            _pool = pool
     return _pool
 
 
+def _warn_pool_budget(max_size: int) -> None:
+    if max_size * WORKERS > POOL_BUDGET:
+        log.warning(
+            "DB_POOL_BUDGET=%d is below WEB_CONCURRENCY=%d; each worker still "
+            "needs 1 connection, so up to %d connections may be opened",
+            POOL_BUDGET,
+            WORKERS,
+            max_size * WORKERS,
+        )
+    if max_size == 1:
+        log.warning(
+            "per-worker pool has a single connection; background jobs and "
+            "rollup can block interactive tools (give each worker at least 2)"
+        )
+
+
+@asynccontextmanager
+async def acquire_background():
+    """Acquire a pool connection for background work.
+
+    Background work may hold at most max_size - 1 connections at once, so at
+    least one stays free for interactive tools (unless the per-worker pool
+    is a single connection).
+    """
+    global _background_slots
+    pool = await get_pool()
+    if _background_slots is None:
+        _background_slots = asyncio.Semaphore(max(1, pool.get_max_size() - 1))
+    async with _background_slots, pool.acquire() as conn:
+        yield conn
+
+
 async def _init_schema(pool: asyncpg.Pool) -> None:
     schema_path = Path(__file__).parent.parent / "sql" / "schema.sql"
     schema_sql = schema_path.read_text()
     async with pool.acquire() as conn:
-        await conn.execute(schema_sql)
+        # Workers start concurrently and CREATE ... IF NOT EXISTS is not race-free.
+        # A transaction-scoped lock is released at COMMIT, so it also works
+        # behind pgbouncer's transaction pooling.
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", _SCHEMA_LOCK_KEY)
+            await conn.execute(schema_sql)
 
 
 async def close_pool() -> None:
@@ -48,7 +130,9 @@ async def save_artifact(
         row = await conn.fetchrow(
             """
             INSERT INTO artifacts (project, type, title, content, tags, source_session)
-            VALUES ($1, $2, $3, $4, $5::jsonb, $6)
+            VALUES ($1, $2, $3, $4, $5::jsonb,
+                    -- Unknown sessions are dropped rather than failing the FK
+                    (SELECT session_id FROM sessions WHERE session_id = $6))
             RETURNING id, project, type, title, content, tags, source_session, created_at
             """,
             project,
@@ -61,28 +145,145 @@ async def save_artifact(
         return _row_to_dict(row)
 
 
+# Search scoring: score = text rank * type weight * recency decay, where the
+# decay halves every SEARCH_HALF_LIFE_DAYS but never drops below
+# SEARCH_RECENCY_FLOOR, and auto-captured/auto-sync rows are demoted.
+SEARCH_HALF_LIFE_DAYS = float(os.environ.get("SEARCH_HALF_LIFE_DAYS", "30"))
+SEARCH_RECENCY_FLOOR = float(os.environ.get("SEARCH_RECENCY_FLOOR", "0.3"))
+SEARCH_AUTO_WEIGHT = float(os.environ.get("SEARCH_AUTO_WEIGHT", "0.5"))
+# Only the newest N matches per project are scored, so a common term that
+# matches 100k rows still stops early on idx_artifacts_project_created.
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", "1000"))
+SEARCH_TYPE_WEIGHTS = json.dumps({
+    k.strip(): float(v)
+    for k, v in (
+        item.split("=", 1)
+        for item in os.environ.get(
+            "SEARCH_TYPE_WEIGHTS", "decision=1.5,code_change=1.2,note=1.0,context=1.0"
+        ).split(",")
+        if "=" in item
+    )
+})
+
+# ts_rank normalization 32 maps rank into [0, 1) so scores from separate
+# per-project queries can be merged on the same scale.
+_SEARCH_SQL = """
+    WITH candidates AS MATERIALIZED (
+      SELECT id, project, type, title, content, tags, source_session, created_at,
+             search_vector
+      FROM artifacts
+      WHERE search_vector @@ websearch_to_tsquery('english', $1)
+        AND project = $2
+      ORDER BY created_at DESC
+      LIMIT $4
+    ), ranked AS (
+      SELECT c.*,
+             ts_rank(c.search_vector, websearch_to_tsquery('english', $1), 32) AS rank,
+             GREATEST(EXTRACT(EPOCH FROM NOW() - c.created_at)::float8, 0) / 86400 AS age_days,
+             COALESCE(($7::jsonb ->> c.type)::float8, 1.0)
+               * CASE WHEN c.tags ?| ARRAY['auto-captured', 'auto-sync']
+                      THEN $8::float8 ELSE 1.0 END AS weight
+      FROM candidates c
+    )
+    SELECT id, project, type, title, content, tags, source_session, created_at, rank,
+           rank * weight
+             * ($6::float8 + (1 - $6::float8) * power(0.5, age_days / $5::float8)) AS score
+    FROM ranked
+    ORDER BY score DESC
+    LIMIT $3
+"""
+
+
+async def _fetch_search(
+    conn: asyncpg.Connection, query: str, project: str, limit: int
+) -> list[asyncpg.Record]:
+    return await conn.fetch(
+        _SEARCH_SQL,
+        query,
+        project,
+        limit,
+        max(limit, SEARCH_CANDIDATES),
+        SEARCH_HALF_LIFE_DAYS,
+        SEARCH_RECENCY_FLOOR,
+        SEARCH_TYPE_WEIGHTS,
+        SEARCH_AUTO_WEIGHT,
+    )
+
+
 async def search_artifacts(
     query: str, project: str = "default", limit: int = 5
 ) -> list[dict]:
     pool = await get_pool()
     async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT id, project, type, title, content, tags, source_session, created_at,
-                   ts_rank(search_vector, websearch_to_tsquery('english', $1)) AS rank
-            FROM artifacts
-            WHERE search_vector @@ websearch_to_tsquery('english', $1)
-              AND project = $2
-            ORDER BY rank DESC
-            LIMIT $3
-            """,
-            query,
-            project,
-            limit,
-        )
+        rows = await _fetch_search(conn, query, project, limit)
         return [_row_to_dict(row) for row in rows]
 
 
+async def search_many(
+    query: str,
+    projects: list[str] | None = None,
+    pattern: str | None = None,
+    limit: int = 10,
+    per_project: int | None = None,
+) -> dict:
+    """Search several projects concurrently and merge the top results.
+
+    Projects come from the explicit list plus any project matching the glob
+    pattern. Each project is queried on its own pool connection; at most
+    per_project results (default: an even share of limit) are taken from
+    each before leftover slots are filled by score.
+    """
+    pool = await get_pool()
+    names = list(dict.fromkeys(projects or []))
+    if pattern:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT DISTINCT project FROM artifacts WHERE project LIKE $1 ORDER BY project",
+                _glob_to_like(pattern),
+            )
+        names.extend(r["project"] for r in rows if r["project"] not in names)
+    names = names[:MAX_SEARCH_PROJECTS]
+    if not names:
+        return {"projects": [], "results": []}
+
+    # Leave a connection free for other requests while fanning out.
+    sem = asyncio.Semaphore(max(1, pool.get_max_size() - 1))
+
+    async def search_one(name: str) -> list[asyncpg.Record]:
+        async with sem, pool.acquire() as conn:
+            return await _fetch_search(conn, query, name, limit)
+
+    per_project_rows = await asyncio.gather(*(search_one(n) for n in names))
+    quota = per_project or max(1, -(-limit // len(names)))
+    merged = _merge_with_quota(
+        [row for rows in per_project_rows for row in rows], limit, quota
+    )
+    return {"projects": names, "results": [_row_to_dict(r) for r in merged]}
+
+
+def _merge_with_quota(
+    rows: list[asyncpg.Record], limit: int, quota: int
+) -> list[asyncpg.Record]:
+    """Top rows by score, at most quota per project unless slots would go unused."""
+    ranked = sorted(rows, key=lambda r: r["score"], reverse=True)
+    taken: list[asyncpg.Record] = []
+    overflow: list[asyncpg.Record] = []
+    counts: dict[str, int] = {}
+    for row in ranked:
+        if counts.get(row["project"], 0) < quota:
+            counts[row["project"]] = counts.get(row["project"], 0) + 1
+            taken.append(row)
+        else:
+            overflow.append(row)
+    taken = taken[:limit] + overflow[: max(0, limit - len(taken))]
+    return sorted(taken, key=lambda r: r["score"], reverse=True)
+
+
+def _glob_to_like(pattern: str) -> str:
+    escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("?", "_")
+
+
 async def get_summary(project: str = "default") -> dict:
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -164,29 +365,103 @@ async def upsert_session(
     source: str,
     project: str = "default",
     summary: str = "",
+    metadata: dict | None = None,
 ) -> dict:
     pool = await get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow(
             """
-            INSERT INTO sessions (session_id, source, project, summary)
-            VALUES ($1, $2, $3, $4)
+            INSERT INTO sessions (session_id, source, project, summary, metadata)
+            VALUES ($1, $2, $3, $4, $5::jsonb)
             ON CONFLICT (session_id) DO UPDATE
               SET summary = EXCLUDED.summary,
-                  ended_at = NOW()
+                  ended_at = NOW(),
+                  metadata = COALESCE(sessions.metadata, '{}') || EXCLUDED.metadata
             RETURNING id, session_id, source, project, summary, started_at, ended_at
             """,
             session_id,
             source,
             project,
             summary,
+            json.dumps(metadata or {}),
         )
         return _row_to_dict(row)
 
 
+# log_session accepts arbitrary metadata, so every digest field is type-checked
+# before it is cast; a malformed session is ignored rather than failing the query.
+_DIGEST_IS_OBJECT = "jsonb_typeof(metadata->'digest') = 'object'"
+
+
+def _digest_number(path: str) -> str:
+    expr = f"metadata->'digest'{path}"
+    return f"CASE WHEN jsonb_typeof({expr}) = 'number' THEN ({expr})::numeric END"
+
+
+def _digest_counts(key: str) -> str:
+    """Set-returning (key, value) pairs of a digest count map, {} if malformed."""
+    expr = f"s.metadata->'digest'->'{key}'"
+    return f"jsonb_each(CASE WHEN jsonb_typeof({expr}) = 'object' THEN {expr} ELSE '{{}}' END)"
+
+
+async def get_session_stats(project: str = "default", days: int = 30) -> dict:
+    """Aggregate the SessionEnd digests stored in sessions.metadata."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        totals = await conn.fetchrow(
+            f"""
+            SELECT COUNT(*) AS sessions,
+                   COALESCE(SUM({_digest_number("->'turns'")}), 0)::bigint AS turns,
+                   COALESCE(SUM({_digest_number("->'error_count'")}), 0)::bigint AS errors,
+                   COALESCE(SUM({_digest_number("->'bytes'")}), 0)::bigint AS bytes,
+                   COALESCE(SUM({_digest_number("->'tokens'->'input'")}), 0)::bigint AS input_tokens,
+                   COALESCE(SUM({_digest_number("->'tokens'->'output'")}), 0)::bigint AS output_tokens
+            FROM sessions
+            WHERE project = $1 AND started_at > NOW() - make_interval(days => $2)
+              AND {_DIGEST_IS_OBJECT}
+            """,
+            project,
+            days,
+        )
+
+        tools = await conn.fetch(
+            f"""
+            SELECT t.key AS tool, SUM(t.value::numeric)::bigint AS count
+            FROM sessions s CROSS JOIN LATERAL {_digest_counts("tools")} t
+            WHERE s.project = $1 AND s.started_at > NOW() - make_interval(days => $2)
+              AND jsonb_typeof(t.value) = 'number'
+            GROUP BY t.key
+            ORDER BY count DESC
+            LIMIT 20
+            """,
+            project,
+            days,
+        )
+
+        files = await conn.fetch(
+            f"""
+            SELECT f.key AS file, SUM(f.value::numeric)::bigint AS count, COUNT(*) AS sessions
+            FROM sessions s CROSS JOIN LATERAL {_digest_counts("files")} f
+            WHERE s.project = $1 AND s.started_at > NOW() - make_interval(days => $2)
+              AND jsonb_typeof(f.value) = 'number'
+            GROUP BY f.key
+            ORDER BY count DESC
+            LIMIT 20
+            """,
+            project,
+            days,
+        )
+
+        return {
+            "project": project,
+            "days": days,
+            **_row_to_dict(totals),
+            "top_tools": {r["tool"]: r["count"] for r in tools},
+            "top_files": [_row_to_dict(r) for r in files],
+        }
+
+
 def _row_to_dict(row: asyncpg.Record) -> dict:
-    d = dict(row)
-    for key, val in d.items():
-        if hasattr(val, "isoformat"):
-            d[key] = val.isoformat()
-    return d
+    # Datetimes are left as-is: tool results are encoded with orjson
+    # (app._json), which writes them natively as ISO 8601.
+    return dict(row)
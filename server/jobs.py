@@ -0,0 +1,284 @@
+"""Durable background job queue backed by the ``jobs`` table.
+
+MCP tools enqueue jobs and poll their status; a worker loop in each server
+process claims queued jobs with FOR UPDATE SKIP LOCKED and runs them on the
+event loop. Per-type concurrency limits (JOB_CONCURRENCY, default 1) are
+enforced across all workers. Background work takes connections through
+db.acquire_background(), which leaves one pool connection for interactive
+tools, and handlers work in short batches.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections.abc import Awaitable, Callable
+
+import asyncpg
+
+from server import db, rollup
+
+log = logging.getLogger(__name__)
+
+WORKER_ENABLED = os.environ.get("JOB_WORKER", "1") == "1"
+POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+# A running job whose heartbeat is older than this is assumed to have died
+# with its worker and is re-queued (or failed after MAX_ATTEMPTS).
+STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+CONCURRENCY = {
+    k.strip(): int(v)
+    for k, v in (
+        item.split("=", 1)
+        for item in os.environ.get(
+            "JOB_CONCURRENCY", "rollup=1,retention=1,reindex=1"
+        ).split(",")
+        if "=" in item
+    )
+}
+
+_BATCH_ROWS = 1000
+
+Report = Callable[..., Awaitable[None]]
+
+_CLAIM = """
+    UPDATE jobs
+    SET status = 'running', started_at = NOW(), heartbeat_at = NOW(),
+        attempts = attempts + 1
+    WHERE id = (
+      SELECT id FROM jobs
+      WHERE type = $1 AND status = 'queued'
+      ORDER BY created_at, id
+      FOR UPDATE SKIP LOCKED
+      LIMIT 1
+    )
+    RETURNING id, type, params
+"""
+
+_REQUEUE_STALE = """
+    UPDATE jobs
+    SET status = CASE WHEN attempts >= $2 THEN 'failed' ELSE 'queued' END,
+        error = 'worker stopped responding',
+        finished_at = CASE WHEN attempts >= $2 THEN NOW() END
+    WHERE status = 'running'
+      AND heartbeat_at < NOW() - make_interval(secs => $1)
+"""
+
+_JOB_COLUMNS = """id, type, params, status, progress, detail, result, error, attempts,
+                  created_at, started_at, heartbeat_at, finished_at"""
+
+
+async def enqueue(type: str, params: dict | None = None) -> dict:
+    pool = await db.get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            f"""
+            INSERT INTO jobs (type, params)
+            VALUES ($1, $2::jsonb)
+            RETURNING {_JOB_COLUMNS}
+            """,
+            type,
+            json.dumps(params or {}),
+        )
+        return dict(row)
+
+
+async def get_job(job_id: int) -> dict | None:
+    pool = await db.get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = $1", job_id
+        )
+        return dict(row) if row else None
+
+
+async def run_worker(poll: float = POLL_SECONDS) -> None:
+    active: dict[str, set[asyncio.Task]] = {t: set() for t in HANDLERS}
+    try:
+        while True:
+            try:
+                await _requeue_stale()
+                for type in HANDLERS:
+                    limit = CONCURRENCY.get(type, 1)
+                    while len(active[type]) < limit:
+                        job = await _claim(type, limit)
+                        if job is None:
+                            break
+                        task = asyncio.create_task(_run(job))
+                        active[type].add(task)
+                        task.add_done_callback(active[type].discard)
+            except Exception:
+                log.exception("job worker poll failed")
+            await asyncio.sleep(poll)
+    finally:
+        # Interrupted jobs keep status 'running' and are re-queued once stale.
+        tasks = [t for tasks in active.values() for t in tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _claim(type: str, limit: int) -> asyncpg.Record | None:
+    async with db.acquire_background() as conn:
+        async with conn.transaction():
+            # Serialize claimers of one type so the running count can't race.
+            await conn.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('jobs:' || $1))", type
+            )
+            running = await conn.fetchval(
+                "SELECT COUNT(*) FROM jobs WHERE type = $1 AND status = 'running'",
+                type,
+            )
+            if running >= limit:
+                return None
+            return await conn.fetchrow(_CLAIM, type)
+
+
+async def _requeue_stale() -> None:
+    async with db.acquire_background() as conn:
+        await conn.execute(_REQUEUE_STALE, float(STALE_SECONDS), MAX_ATTEMPTS)
+
+
+async def _update(sql: str, *args) -> None:
+    async with db.acquire_background() as conn:
+        await conn.execute(sql, *args)
+
+
+async def _heartbeat(job_id: int) -> None:
+    # Bypasses the background cap: it's a single-row update, and queuing it
+    # behind a long REINDEX would make a live job look dead.
+    pool = await db.get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("UPDATE jobs SET heartbeat_at = NOW() WHERE id = $1", job_id)
+
+
+async def _run(job: asyncpg.Record) -> None:
+    job_id = job["id"]
+
+    async def report(progress: float, **detail) -> None:
+        await _update(
+            """
+            UPDATE jobs SET progress = $2, detail = $3::jsonb, heartbeat_at = NOW()
+            WHERE id = $1
+            """,
+            job_id,
+            min(max(progress, 0.0), 1.0),
+            json.dumps(detail),
+        )
+
+    async def heartbeat() -> None:
+        while True:
+            await asyncio.sleep(STALE_SECONDS / 3)
+            await _heartbeat(job_id)
+
+    beat = asyncio.create_task(heartbeat())
+    try:
+        result = await HANDLERS[job["type"]](json.loads(job["params"]), report)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log.exception("job %d (%s) failed", job_id, job["type"])
+        await _update(
+            """
+            UPDATE jobs SET status = 'failed', error = $2, finished_at = NOW()
+            WHERE id = $1
+            """,
+            job_id,
+            f"{type(e).__name__}: {e}",
+        )
+    else:
+        await _update(
+            """
+            UPDATE jobs SET status = 'succeeded', progress = 1, result = $2::jsonb,
+                            error = NULL, finished_at = NOW()
+            WHERE id = $1
+            """,
+            job_id,
+            json.dumps(result, default=str),
+        )
+    finally:
+        beat.cancel()
+
+
+async def _rollup_job(params: dict, report: Report) -> dict:
+    """Run rollup batches until nothing is left to compact."""
+    totals = {"digests": 0, "rows_compacted": 0, "bytes_reclaimed": 0}
+    max_batches = int(params.get("max_batches", 100))
+    min_age_hours = int(params.get("min_age_hours", rollup.MIN_AGE_HOURS))
+    if max_batches <= 0 or min_age_hours < 0:
+        raise ValueError(
+            "max_batches must be positive and min_age_hours non-negative"
+        )
+    for batch in range(max_batches):
+        stats = await rollup.rollup_once(min_age_hours=min_age_hours)
+        for key in totals:
+            totals[key] += stats[key]
+        if not stats["digests"]:
+            break
+        await report((batch + 1) / max_batches, **totals)
+    return totals
+
+
+async def _retention_job(params: dict, report: Report) -> dict:
+    """Delete a project's artifacts older than N days, in small batches."""
+    project = params["project"]
+    days = int(params["older_than_days"])
+    if days <= 0:
+        raise ValueError("older_than_days must be a positive integer")
+    async with db.acquire_background() as conn:
+        total = await conn.fetchval(
+            """
+            SELECT COUNT(*) FROM artifacts
+            WHERE project = $1 AND created_at < NOW() - make_interval(days => $2)
+            """,
+            project,
+            days,
+        )
+
+    deleted = 0
+    while True:
+        async with db.acquire_background() as conn:
+            status = await conn.execute(
+                """
+                DELETE FROM artifacts WHERE id IN (
+                  SELECT id FROM artifacts
+                  WHERE project = $1 AND created_at < NOW() - make_interval(days => $2)
+                  LIMIT $3
+                )
+                """,
+                project,
+                days,
+                _BATCH_ROWS,
+            )
+        count = int(status.rsplit(" ", 1)[-1])
+        if not count:
+            break
+        deleted += count
+        await report(deleted / max(total, deleted), deleted=deleted, total=total)
+    return {"project": project, "deleted": deleted}
+
+
+_REINDEX_TARGETS = (
+    "idx_artifacts_search",
+    "idx_artifacts_project",
+    "idx_artifacts_type",
+    "idx_artifacts_created",
+    "idx_artifacts_project_created",
+    "idx_artifacts_auto_captured",
+)
+
+
+async def _reindex_job(params: dict, report: Report) -> dict:
+    """Rebuild the artifact indexes one at a time without blocking writes."""
+    for i, index in enumerate(_REINDEX_TARGETS):
+        async with db.acquire_background() as conn:
+            await conn.execute(f"REINDEX INDEX CONCURRENTLY {index}")
+        await report((i + 1) / len(_REINDEX_TARGETS), index=index)
+    return {"reindexed": list(_REINDEX_TARGETS)}
+
+
+HANDLERS: dict[str, Callable[[dict, Report], Awaitable[dict]]] = {
+    "rollup": _rollup_job,
+    "retention": _retention_job,
+    "reindex": _reindex_job,
+}
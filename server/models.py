@@ -9,6 +9,7 @@ class SaveContextInput(BaseModel):
     type: str = Field(description="Type: decision, context, note, or code_change")
     title: str | None = Field(default=None, description="Optional title")
     tags: list[str] = Field(default_factory=list, description="Optional tags")
+    source_session: str | None = Field(default=None, description="Originating session_id")
 
 
 class SearchContextInput(BaseModel):
@@ -17,6 +18,14 @@ class SearchContextInput(BaseModel):
     limit: int = Field(default=5, description="Max results to return", ge=1, le=50)
 
 
+class SearchAcrossProjectsInput(BaseModel):
+    query: str = Field(description="Full-text search query")
+    projects: list[str] = Field(default_factory=list, description="Projects to search")
+    pattern: str = Field(default="", description="Glob matched against project names")
+    limit: int = Field(default=10, description="Max merged results", ge=1, le=50)
+    per_project: int = Field(default=0, description="Max results per project (0 = even share)", ge=0)
+
+
 class GetProjectSummaryInput(BaseModel):
     project: str = Field(default="default", description="Project identifier")
 
@@ -37,3 +46,18 @@ class LogSessionInput(BaseModel):
     source: str = Field(description="Source: claude_ai or claude_code")
     project: str = Field(default="default", description="Project identifier")
     summary: str = Field(default="", description="Session summary")
+    metadata: dict = Field(default_factory=dict, description="Structured session stats")
+
+
+class GetSessionStatsInput(BaseModel):
+    project: str = Field(default="default", description="Project identifier")
+    days: int = Field(default=30, description="How many days back to look", ge=1, le=365)
+
+
+class EnqueueJobInput(BaseModel):
+    type: str = Field(description="Job type: rollup, retention, or reindex")
+    params: dict = Field(default_factory=dict, description="Job options")
+
+
+class GetJobStatusInput(BaseModel):
+    job_id: int = Field(description="Job id returned by enqueue_job")
@@ -0,0 +1,178 @@
+"""Background rollup of auto-captured artifacts into daily digests.
+
+The PreCompact hook saves a new ``auto-captured`` artifact, linked to its
+session, on every compaction. Once those are older than
+ROLLUP_MIN_AGE_HOURS, each (project, session, day) group is merged into
+one digest artifact with deduplicated messages and merged tags, and the
+originals are deleted (or moved to ``artifacts_archive`` with
+ROLLUP_ARCHIVE=1). Captures without a session are grouped per project
+and day.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+
+import asyncpg
+
+from server import db
+
+log = logging.getLogger(__name__)
+
+# 0 disables the background loop.
+INTERVAL_SECONDS = int(os.environ.get("ROLLUP_INTERVAL_SECONDS", "0"))
+MIN_AGE_HOURS = int(os.environ.get("ROLLUP_MIN_AGE_HOURS", "72"))
+BATCH_GROUPS = int(os.environ.get("ROLLUP_BATCH_GROUPS", "50"))
+ARCHIVE = os.environ.get("ROLLUP_ARCHIVE", "0") == "1"
+
+# The tag predicates are literals so the partial index can be used.
+_FIND_GROUPS = """
+    SELECT project, source_session, (created_at AT TIME ZONE 'UTC')::date AS day,
+           array_agg(id ORDER BY created_at) AS ids
+    FROM artifacts
+    WHERE tags ? 'auto-captured' AND NOT tags ? 'digest'
+      AND created_at < NOW() - make_interval(hours => $1)
+    GROUP BY 1, 2, 3
+    HAVING COUNT(*) > 1
+    ORDER BY 3
+    LIMIT $2
+"""
+
+_LOCK_GROUP = """
+    SELECT id, content, tags, created_at, pg_column_size(artifacts.*) AS size
+    FROM artifacts
+    WHERE id = ANY($1::int[])
+    ORDER BY created_at
+    FOR UPDATE SKIP LOCKED
+"""
+
+_INSERT_DIGEST = """
+    INSERT INTO artifacts (project, type, title, content, tags, source_session, created_at)
+    VALUES ($1, 'context', $2, $3, $4::jsonb, $5, $6)
+    RETURNING id, pg_column_size(artifacts.*) AS size
+"""
+
+_ARCHIVE_ORIGINALS = """
+    WITH moved AS (
+      DELETE FROM artifacts WHERE id = ANY($1::int[])
+      RETURNING id, project, type, title, content, tags, source_session, created_at
+    )
+    INSERT INTO artifacts_archive
+      (id, project, type, title, content, tags, source_session, created_at, digest_id)
+    SELECT id, project, type, title, content, tags, source_session, created_at, $2
+    FROM moved
+"""
+
+_DELETE_ORIGINALS = "DELETE FROM artifacts WHERE id = ANY($1::int[])"
+
+# Split before each "- " item that starts a line (see hooks/pre-compact.py).
+_ITEM_BOUNDARY = re.compile(r"\n(?=- )")
+
+
+async def rollup_once(
+    min_age_hours: int = MIN_AGE_HOURS, max_groups: int = BATCH_GROUPS
+) -> dict:
+    """Compact up to max_groups groups, one transaction per group.
+
+    Returns the number of digests written, rows compacted and the
+    approximate bytes reclaimed (row size of originals minus digests).
+    """
+    async with db.acquire_background() as conn:
+        groups = await conn.fetch(_FIND_GROUPS, min_age_hours, max_groups)
+
+    stats = {"digests": 0, "rows_compacted": 0, "bytes_reclaimed": 0}
+    for group in groups:
+        # Release the connection between groups so interactive tools interleave.
+        async with db.acquire_background() as conn:
+            result = await _compact_group(conn, group)
+        if result is None:
+            continue
+        rows, reclaimed = result
+        stats["digests"] += 1
+        stats["rows_compacted"] += rows
+        stats["bytes_reclaimed"] += reclaimed
+    return stats
+
+
+async def run_forever(interval: int = INTERVAL_SECONDS) -> None:
+    while True:
+        try:
+            stats = await rollup_once()
+            if stats["digests"]:
+                log.info(
+                    "rollup: %d rows -> %d digests, ~%d bytes reclaimed",
+                    stats["rows_compacted"],
+                    stats["digests"],
+                    stats["bytes_reclaimed"],
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("rollup failed")
+        await asyncio.sleep(interval)
+
+
+async def _compact_group(
+    conn: asyncpg.Connection, group: asyncpg.Record
+) -> tuple[int, int] | None:
+    async with conn.transaction():
+        # Another worker may be compacting the same group; take what's free.
+        rows = await conn.fetch(_LOCK_GROUP, group["ids"])
+        if len(rows) < 2:
+            return None
+
+        ids = [r["id"] for r in rows]
+        digest = await conn.fetchrow(
+            _INSERT_DIGEST,
+            group["project"],
+            _digest_title(group, len(rows)),
+            _merge_content(rows),
+            json.dumps(_merge_tags(rows)),
+            group["source_session"],
+            rows[-1]["created_at"],
+        )
+        if ARCHIVE:
+            await conn.execute(_ARCHIVE_ORIGINALS, ids, digest["id"])
+        else:
+            await conn.execute(_DELETE_ORIGINALS, ids)
+
+    reclaimed = sum(r["size"] for r in rows) - digest["size"]
+    return len(rows), reclaimed
+
+
+def _digest_title(group: asyncpg.Record, captures: int) -> str:
+    session = group["source_session"] or "no session"
+    return (
+        f"Digest — {group['project']} @ {group['day']} "
+        f"[{session}] ({captures} captures)"
+    )
+
+
+def _merge_content(rows: list[asyncpg.Record]) -> str:
+    """Concatenate messages in capture order, dropping repeated messages.
+
+    PreCompact writes one "- " item per user message, and an item can span
+    several lines, so whole items are compared rather than single lines.
+    """
+    seen = set()
+    items = []
+    for row in rows:
+        for item in _ITEM_BOUNDARY.split(row["content"]):
+            key = item.strip()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            items.append(item.rstrip())
+    return "\n".join(items)
+
+
+def _merge_tags(rows: list[asyncpg.Record]) -> list[str]:
+    tags = []
+    for row in rows:
+        for tag in json.loads(row["tags"] or "[]"):
+            if tag not in tags:
+                tags.append(tag)
+    tags.append("digest")
+    return tags
@@ -0,0 +1,226 @@
+"""Streaming export/import of a project's memory as gzip'd NDJSON.
+
+Each line is ``{"table": "sessions" | "artifacts", "row": {...}}``. Sessions
+come first so imported artifacts can keep their ``source_session`` link.
+Both directions stream, so memory use does not grow with project size.
+
+Usage:
+    python -m server.transfer export PROJECT [-o FILE]
+    python -m server.transfer import FILE [--project NAME] [--on-conflict skip|update]
+"""
+
+import argparse
+import asyncio
+import sys
+import zlib
+from collections.abc import AsyncIterable, AsyncIterator
+
+from server import db
+
+_PREFETCH = 1000
+_CHUNK_BYTES = 64 * 1024
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+_EXPORT_QUERIES = (
+    """
+    SELECT jsonb_build_object('table', 'sessions', 'row', to_jsonb(s) - 'id')::text
+    FROM sessions s
+    WHERE project = $1
+    ORDER BY id
+    """,
+    """
+    SELECT jsonb_build_object(
+             'table', 'artifacts',
+             'row', to_jsonb(a) - ARRAY['id', 'search_vector']
+           )::text
+    FROM artifacts a
+    WHERE project = $1
+    ORDER BY id
+    """,
+)
+
+# DISTINCT ON keeps one row per session_id; ON CONFLICT can't touch a row twice.
+_MERGE_SESSIONS = """
+    INSERT INTO sessions (session_id, source, project, summary, started_at, ended_at, metadata)
+    SELECT DISTINCT ON (r.session_id)
+           r.session_id, r.source, COALESCE($1, r.project), r.summary,
+           r.started_at, r.ended_at, COALESCE(r.metadata, '{}')
+    FROM _import_lines l
+    CROSS JOIN LATERAL jsonb_populate_record(NULL::sessions, l.doc->'row') r
+    WHERE l.doc->>'table' = 'sessions' AND r.session_id IS NOT NULL
+    ORDER BY r.session_id
+    ON CONFLICT (session_id) DO {action}
+"""
+
+_SESSION_CONFLICT_ACTIONS = {
+    "skip": "NOTHING",
+    "update": """UPDATE
+      SET summary = COALESCE(EXCLUDED.summary, sessions.summary),
+          ended_at = COALESCE(EXCLUDED.ended_at, sessions.ended_at),
+          metadata = sessions.metadata || EXCLUDED.metadata""",
+}
+
+# Artifacts have no natural key; treat same project + timestamp + content as
+# the same artifact, both within the dump and against existing rows, so
+# re-importing a dump is idempotent. Rows without a timestamp can't be
+# matched that way and are skipped.
+_MERGE_ARTIFACTS = """
+    INSERT INTO artifacts (project, type, title, content, tags, source_session, created_at)
+    SELECT r.project, r.type, r.title, r.content, r.tags, s.session_id, r.created_at
+    FROM (
+      SELECT DISTINCT ON (COALESCE($1, r.project), r.created_at, r.content)
+             COALESCE($1, r.project) AS project, r.type, r.title, r.content,
+             COALESCE(r.tags, '[]') AS tags, r.source_session, r.created_at
+      FROM _import_lines l
+      CROSS JOIN LATERAL jsonb_populate_record(NULL::artifacts, l.doc->'row') r
+      WHERE l.doc->>'table' = 'artifacts' AND r.created_at IS NOT NULL
+      ORDER BY COALESCE($1, r.project), r.created_at, r.content
+    ) r
+    LEFT JOIN sessions s ON s.session_id = r.source_session
+    WHERE NOT EXISTS (
+      SELECT 1 FROM artifacts a
+      WHERE a.project = r.project
+        AND a.created_at = r.created_at
+        AND a.content = r.content
+    )
+"""
+
+_COUNT_UNTIMESTAMPED = """
+    SELECT COUNT(*) FROM _import_lines
+    WHERE doc->>'table' = 'artifacts' AND doc->'row'->>'created_at' IS NULL
+"""
+
+
+async def export_project(project: str) -> AsyncIterator[bytes]:
+    """Yield a gzip'd NDJSON dump of a project's sessions and artifacts."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS)
+    pool = await db.get_pool()
+    async with pool.acquire() as conn:
+        # One snapshot for both tables; server-side cursors need a transaction.
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            buf = bytearray()
+            for query in _EXPORT_QUERIES:
+                async for rec in conn.cursor(query, project, prefetch=_PREFETCH):
+                    buf += rec[0].encode()
+                    buf += b"\n"
+                    if len(buf) >= _CHUNK_BYTES:
+                        out = gz.compress(bytes(buf))
+                        buf.clear()
+                        if out:
+                            yield out
+            if buf:
+                yield gz.compress(bytes(buf))
+    yield gz.flush()
+
+
+async def import_ndjson(
+    chunks: AsyncIterable[bytes],
+    project: str | None = None,
+    on_conflict: str = "skip",
+) -> dict:
+    """Stream a gzip'd NDJSON dump into staging with COPY, then merge it.
+
+    Args:
+        chunks: Raw gzip bytes, in any chunking
+        project: Import everything into this project instead of the original one
+        on_conflict: For sessions that already exist: 'skip' or 'update'
+    """
+    if on_conflict not in _SESSION_CONFLICT_ACTIONS:
+        raise ValueError("on_conflict must be 'skip' or 'update'")
+
+    pool = await db.get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "CREATE TEMP TABLE _import_lines (doc JSONB) ON COMMIT DROP"
+            )
+            # JSON never contains raw \x01/\x02 or newlines, so CSV with those
+            # as quote/delimiter passes each line through without escaping.
+            await conn.copy_to_table(
+                "_import_lines",
+                source=_gunzip(chunks),
+                columns=["doc"],
+                format="csv",
+                quote="\x01",
+                delimiter="\x02",
+            )
+            sessions = await conn.execute(
+                _MERGE_SESSIONS.format(action=_SESSION_CONFLICT_ACTIONS[on_conflict]),
+                project,
+            )
+            artifacts = await conn.execute(_MERGE_ARTIFACTS, project)
+            skipped = await conn.fetchval(_COUNT_UNTIMESTAMPED)
+            lines = await conn.fetchval(
+                "SELECT COUNT(*) FROM _import_lines WHERE doc IS NOT NULL"
+            )
+
+    return {
+        "lines": lines,
+        "sessions": _row_count(sessions),
+        "artifacts": _row_count(artifacts),
+        "skipped_no_timestamp": skipped,
+    }
+
+
+async def _gunzip(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    gz = zlib.decompressobj(_GZIP_WBITS)
+    async for chunk in chunks:
+        out = gz.decompress(chunk)
+        if out:
+            yield out
+    tail = gz.flush()
+    if tail:
+        yield tail
+    # flush() doesn't raise on a cut-off stream; without this a partial
+    # export would be imported and reported as success.
+    if not gz.eof:
+        raise ValueError("truncated gzip stream")
+
+
+def _row_count(status: str) -> int:
+    # asyncpg returns the command tag, e.g. "INSERT 0 42"
+    return int(status.rsplit(" ", 1)[-1])
+
+
+async def _read_file(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_BYTES):
+            yield chunk
+
+
+async def _main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(prog="python -m server.transfer")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="Write a project dump (.ndjson.gz)")
+    exp.add_argument("project")
+    exp.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    imp = sub.add_parser("import", help="Load a project dump (.ndjson.gz)")
+    imp.add_argument("file")
+    imp.add_argument("--project", help="Import into this project instead")
+    imp.add_argument("--on-conflict", choices=["skip", "update"], default="skip")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "export":
+            out = open(args.output, "wb") if args.output else sys.stdout.buffer
+            try:
+                async for chunk in export_project(args.project):
+                    out.write(chunk)
+            finally:
+                if args.output:
+                    out.close()
+        else:
+            result = await import_ndjson(
+                _read_file(args.file),
+                project=args.project,
+                on_conflict=args.on_conflict,
+            )
+            print(result, file=sys.stderr)
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -24,8 +24,46 @@ CREATE TABLE IF NOT EXISTS artifacts (
   ) STORED
 );
 
+-- Originals replaced by a rollup digest (only kept with ROLLUP_ARCHIVE=1)
+CREATE TABLE IF NOT EXISTS artifacts_archive (
+  id INTEGER PRIMARY KEY,
+  project TEXT NOT NULL,
+  type TEXT NOT NULL,
+  title TEXT,
+  content TEXT NOT NULL,
+  tags JSONB,
+  source_session TEXT,
+  created_at TIMESTAMPTZ,
+  digest_id INTEGER,
+  archived_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Background maintenance jobs (see server/jobs.py)
+CREATE TABLE IF NOT EXISTS jobs (
+  id BIGSERIAL PRIMARY KEY,
+  type TEXT NOT NULL,
+  params JSONB NOT NULL DEFAULT '{}',
+  status TEXT NOT NULL DEFAULT 'queued'
+    CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+  progress REAL NOT NULL DEFAULT 0,
+  detail JSONB DEFAULT '{}',
+  result JSONB,
+  error TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  started_at TIMESTAMPTZ,
+  heartbeat_at TIMESTAMPTZ,
+  finished_at TIMESTAMPTZ
+);
+
 CREATE INDEX IF NOT EXISTS idx_artifacts_search ON artifacts USING GIN(search_vector);
 CREATE INDEX IF NOT EXISTS idx_artifacts_project ON artifacts(project);
 CREATE INDEX IF NOT EXISTS idx_artifacts_type ON artifacts(project, type);
 CREATE INDEX IF NOT EXISTS idx_artifacts_created ON artifacts(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_artifacts_project_created ON artifacts(project, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_sessions_project ON sessions(project);
+CREATE INDEX IF NOT EXISTS idx_sessions_project_started ON sessions(project, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_artifacts_auto_captured ON artifacts(project, created_at)
+  WHERE tags ? 'auto-captured' AND NOT tags ? 'digest';
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs(type, created_at) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs(type, heartbeat_at) WHERE status = 'running';